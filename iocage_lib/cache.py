@@ -14,7 +14,7 @@ class Cache:
     def __init__(self):
         self.fields = [
             'dataset_data', 'pool_data', 'dataset_dep_data', 'ioc_pool', 'ioc_dataset',
-            '_freebsd_version',
+            '_freebsd_version', 'config_pool', 'config_iocroot',
         ]
         self.reset()
 
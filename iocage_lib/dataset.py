@@ -11,8 +11,6 @@ from iocage_lib.zfs import (
 import contextlib
 import os
 
-from copy import deepcopy
-
 
 class Dataset(Resource):
 
@@ -35,7 +33,10 @@ class Dataset(Resource):
                     ))
 
         if self.cache:
-            self._properties = deepcopy(cache.datasets.get(self.resource_name))
+            # Property maps are never modified in place, the cache replaces
+            # them wholesale, so sharing them is safe and saves copying every
+            # property when only one or two are ever looked at.
+            self._properties = cache.datasets.get(self.resource_name)
 
     def create(self, data):
         cache.reset()
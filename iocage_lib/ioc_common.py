@@ -24,6 +24,7 @@
 """Common methods we reuse."""
 import collections
 import contextlib
+import functools
 import ipaddress
 import logging
 import os
@@ -50,6 +51,8 @@ INTERACTIVE = False
 # 4 is a magic number for default and doesn't refer
 # to the actual ruleset 4 in devfs.rules(!)
 IOCAGE_DEVFS_RULESET = 4
+# The USERLAND_VERSION="13.1-RELEASE-p3" line of /bin/freebsd-version
+USERLAND_VERSION_RE = re.compile(r'^USERLAND_VERSION=(.*)$', re.MULTILINE)
 
 
 def callback(_log, callback_exception):
@@ -697,6 +700,7 @@ def parse_latest_release():
     return latest
 
 
+@functools.lru_cache(maxsize=1)
 def get_host_release():
     """Helper to return the hosts sanitized RELEASE"""
     rel = os.uname()[2]
@@ -933,10 +937,14 @@ def get_jail_freebsd_version(path, release):
         with open(
             f'{path}/bin/freebsd-version', mode='r', encoding='utf-8'
         ) as r:
-            for line in r:
-                if line.startswith('USERLAND_VERSION'):
-                    new_release = line.rstrip().partition('=')[
-                        2].strip('"')
+            match = USERLAND_VERSION_RE.search(r.read())
+
+        if not match:
+            raise RuntimeError(
+                f'USERLAND_VERSION not found in {path}/bin/freebsd-version'
+            )
+
+        new_release = match.group(1).strip().strip('"')
 
     return new_release
 
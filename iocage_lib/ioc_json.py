@@ -23,8 +23,10 @@
 # POSSIBILITY OF SUCH DAMAGE.
 """Convert, load or write JSON."""
 import collections
+import concurrent.futures
+import copy
 import datetime
-import fileinput
+import functools
 import ipaddress
 import json
 import logging
@@ -34,6 +36,8 @@ import shutil
 import string
 import subprocess as su
 import sys
+import time
+import types
 
 import iocage_lib.ioc_common
 import iocage_lib.ioc_create
@@ -46,9 +50,490 @@ import netifaces
 import random
 import pathlib
 
+try:
+    import orjson
+except ImportError:
+    # Optional, the json module is used to parse configurations without it
+    orjson = None
+
+from iocage_lib.cache import cache as iocage_cache
 from iocage_lib.dataset import Dataset
 from iocage_lib.pools import PoolListableResource, Pool
 from iocage_lib.snapshot import Snapshot
+from iocage_lib.zfs import IOCAGE_POOL_PROP, get_mounted_dependents
+
+# key = "value"; lines of a legacy UCL configuration, quotes and semicolons
+# are dropped before matching
+_UCL_RE = re.compile(
+    rb'^[^\S\n]*([^=\s]+)[^\S\n]*=[^\S\n]*(.*?)[^\S\n]*$', re.M
+)
+_UCL_DELETE_CHARS = b';"'
+
+
+def _json_loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(data):
+    # orjson can only indent by two spaces, the json module keeps the layout
+    # existing configuration files have
+    return json.dumps(
+        data, sort_keys=True, indent=4, ensure_ascii=False
+    ).encode()
+
+
+_RENAME_MESSAGES = (
+    ('NOTICE', '*' * 80),
+    ('WARNING', 'Jail: {old} was renamed to {new}'),
+    ('NOTICE', f'{"*" * 80}\n'),
+    ('EXCEPTION', 'Please issue your command again.'),
+)
+
+# Read-only default properties which don't depend on the host,
+# retrieve_default_props adds the rest (ioc_common can't be used while this
+# module is imported)
+_GLOBAL_DEFAULT_PROPS = types.MappingProxyType({
+    'interfaces': 'vnet0:bridge0',
+    'host_domainname': 'none',
+    'exec_fib': '0',
+    'ip4_addr': 'none',
+    'ip4_saddrsel': '1',
+    'ip4': 'new',
+    'ip6_addr': 'none',
+    'ip6_saddrsel': '1',
+    'ip6': 'new',
+    'defaultrouter': 'auto',
+    'defaultrouter6': 'auto',
+    'resolver': '/etc/resolv.conf',
+    'vnet0_mac': 'none',
+    'vnet1_mac': 'none',
+    'vnet2_mac': 'none',
+    'vnet3_mac': 'none',
+    'vnet_default_interface': 'auto',
+    'exec_start': '/bin/sh /etc/rc',
+    'exec_stop': '/bin/sh /etc/rc.shutdown',
+    'exec_prestart': '/usr/bin/true',
+    'exec_poststart': '/usr/bin/true',
+    'exec_prestop': '/usr/bin/true',
+    'exec_poststop': '/usr/bin/true',
+    'exec_created': '/usr/bin/true',
+    'exec_clean': 1,
+    'exec_timeout': '60',
+    'stop_timeout': '30',
+    'exec_jail_user': 'root',
+    'exec_system_jail_user': '0',
+    'exec_system_user': 'root',
+    'mount_devfs': 1,
+    'mount_fdescfs': 1,
+    'enforce_statfs': '2',
+    'children_max': '0',
+    'login_flags': '-f root',
+    'securelevel': '2',
+    'sysvmsg': 'new',
+    'sysvsem': 'new',
+    'sysvshm': 'new',
+    'allow_set_hostname': 1,
+    'allow_sysvipc': 0,
+    'allow_raw_sockets': 0,
+    'allow_chflags': 0,
+    'allow_mlock': 0,
+    'allow_mount': 0,
+    'allow_mount_devfs': 0,
+    'allow_mount_fusefs': 0,
+    'allow_mount_nullfs': 0,
+    'allow_mount_procfs': 0,
+    'allow_mount_tmpfs': 0,
+    'allow_mount_zfs': 0,
+    'allow_quotas': 0,
+    'allow_socket_af': 0,
+    'allow_tun': 0,
+    'allow_vmm': 0,
+    'cpuset': 'off',
+    'rlimits': 'off',
+    'memoryuse': 'off',
+    'memorylocked': 'off',
+    'vmemoryuse': 'off',
+    'maxproc': 'off',
+    'cputime': 'off',
+    'pcpu': 'off',
+    'datasize': 'off',
+    'stacksize': 'off',
+    'coredumpsize': 'off',
+    'openfiles': 'off',
+    'pseudoterminals': 'off',
+    'swapuse': 'off',
+    'nthr': 'off',
+    'msgqqueued': 'off',
+    'msgqsize': 'off',
+    'nmsgq': 'off',
+    'nsem': 'off',
+    'nsemop': 'off',
+    'nshm': 'off',
+    'shmsize': 'off',
+    'wallclock': 'off',
+    'readbps': 'off',
+    'writebps': 'off',
+    'readiops': 'off',
+    'writeiops': 'off',
+    'type': 'jail',
+    'bpf': 0,
+    'dhcp': 0,
+    'boot': 0,
+    'notes': 'none',
+    'owner': 'root',
+    'priority': '99',
+    'last_started': 'none',
+    'template': 0,
+    'hostid_strict_check': 0,
+    'jail_zfs': 0,
+    'jail_zfs_mountpoint': 'none',
+    'mount_procfs': 0,
+    'mount_linprocfs': 0,
+    'count': '1',
+    'vnet': 0,
+    'basejail': 0,
+    'comment': 'none',
+    'host_time': 1,
+    'sync_state': 'none',
+    'sync_target': 'none',
+    'sync_tgt_zpool': 'none',
+    'compression': 'lz4',
+    'origin': 'readonly',
+    'quota': 'none',
+    'mountpoint': 'readonly',
+    'compressratio': 'readonly',
+    'available': 'readonly',
+    'used': 'readonly',
+    'dedup': 'off',
+    'reservation': 'none',
+    'depends': 'none',
+    'vnet_interfaces': 'none',
+    'rtsold': 0,
+    'ip_hostname': 0,
+    'assign_localhost': 0,
+    'localhost_ip': 'none',
+    'nat': 0,
+    'nat_prefix': '172.16',
+    'nat_interface': 'none',
+    'nat_backend': 'ipfw',
+    'nat_forwards': 'none',
+    'plugin_name': 'none',
+    'plugin_repository': 'none',
+    'min_dyn_devfs_ruleset': '1000',
+    'vnet0_mtu': 'auto',
+    'vnet1_mtu': 'auto',
+    'vnet2_mtu': 'auto',
+    'vnet3_mtu': 'auto',
+    'vnet_default_mtu': '1500',
+})
+
+# Default properties keyed by the configuration version they were built for
+_DEFAULTS_CACHE = {}
+
+# Parsed JSON files keyed by path, along with the (mtime, size) they were
+# parsed at
+_CONFIG_CACHE = {}
+
+_TRUTH_VARIATIONS = (
+    '0', '1', 'off', 'on', 'no', 'yes', 'false', 'true'
+)
+
+_PRIORITY_VALUES = range(1, 100)
+# int() alone would also take '5_0', ' 7 ', '+5' or non-ASCII digits and the
+# raw string would be stored
+_PRIORITY_RE = re.compile(r'[0-9]{1,2}')
+
+# Keys check_config fills in when a configuration is missing them, or has
+# them empty, along with the version they were introduced in
+_CONFIG_KEY_DEFAULTS = {
+    # Version 2 keys
+    'sysvmsg': 'new',
+    'sysvsem': 'new',
+    'sysvshm': 'new',
+    # Version 4 keys
+    'basejail': 0,
+    # Version 5 keys
+    'comment': 'none',
+    # Version 6 keys
+    'host_time': 1,
+    # Version 7 keys
+    'depends': 'none',
+    # Version 9 keys
+    'dhcp': 0,
+    'bpf': 0,
+    # Version 10 keys
+    'vnet_interfaces': 'none',
+    # Version 11 keys
+    'hostid_strict_check': 0,
+    # Version 12 keys
+    'allow_mlock': 0,
+    # Version 13 keys
+    'vnet_default_interface': 'auto',
+    # Version 14 keys
+    'allow_tun': 0,
+    # Version 15 keys
+    'allow_mount_fusefs': 0,
+    # Version 16 keys
+    'rtsold': 0,
+    # Version 17 keys
+    'allow_vmm': 0,
+    # Version 18 keys
+    'ip_hostname': 0,
+    # Version 20 keys
+    'exec_created': '/usr/bin/true',
+    # Version 21 keys
+    'assign_localhost': 0,
+    # Version 22 keys
+    'localhost_ip': 'none',
+    # Version 23 keys
+    'nat': 0,
+    'nat_prefix': '172.16',
+    'nat_interface': 'none',
+    'nat_backend': 'ipfw',
+    'nat_forwards': 'none',
+    # Version 24 key
+    'plugin_name': 'none',
+    # Version 25 key
+    'plugin_repository': 'none',
+    # Version 27 key
+    'min_dyn_devfs_ruleset': '1000',
+    # Version 28 keys
+    **{f'vnet{x}_mtu': 'auto' for x in range(0, 4)},
+    'vnet_default_mtu': '1500',
+}
+
+# Values json_check_prop accepts for each property, "string" meaning the
+# value gets validated further depending on the property
+_PROPS = {
+    # Network properties
+    "interfaces": (":", ","),
+    "host_domainname": ("string", ),
+    "host_hostname": ("string", ),
+    "exec_fib": ("string", ),
+    "ip4_addr": ("string", ),
+    "ip4_saddrsel": _TRUTH_VARIATIONS,
+    "ip4": ("new", "inherit", "disable"),
+    "ip6_addr": ("string", ),
+    "ip6_saddrsel": _TRUTH_VARIATIONS,
+    "ip6": ("new", "inherit", "disable"),
+    "defaultrouter": ("string", ),
+    "defaultrouter6": ("string", ),
+    "resolver": ("string", ),
+    "mac_prefix": ("string", ),
+    "vnet0_mac": ("string", ),
+    "vnet1_mac": ("string", ),
+    "vnet2_mac": ("string", ),
+    "vnet3_mac": ("string", ),
+    # Jail Properties
+    "devfs_ruleset": ("string", ),
+    "exec_start": ("string", ),
+    "exec_stop": ("string", ),
+    "exec_prestart": ("string", ),
+    "exec_poststart": ("string", ),
+    "exec_prestop": ("string", ),
+    "exec_poststop": ("string", ),
+    "exec_clean": _TRUTH_VARIATIONS,
+    "exec_created": ("string", ),
+    "exec_timeout": ("string", ),
+    "stop_timeout": ("string", ),
+    "exec_jail_user": ("string", ),
+    "exec_system_jail_user": ("string", ),
+    "exec_system_user": ("string", ),
+    "mount_devfs": _TRUTH_VARIATIONS,
+    "mount_fdescfs": _TRUTH_VARIATIONS,
+    "enforce_statfs": ("0", "1", "2"),
+    "children_max": ("string", ),
+    "login_flags": ("string", ),
+    "securelevel": ("string", ),
+    "sysvmsg": ("new", "inherit", "disable"),
+    "sysvsem": ("new", "inherit", "disable"),
+    "sysvshm": ("new", "inherit", "disable"),
+    "allow_set_hostname": _TRUTH_VARIATIONS,
+    "allow_sysvipc": _TRUTH_VARIATIONS,
+    "allow_raw_sockets": _TRUTH_VARIATIONS,
+    "allow_chflags": _TRUTH_VARIATIONS,
+    "allow_mlock": _TRUTH_VARIATIONS,
+    "allow_mount": _TRUTH_VARIATIONS,
+    "allow_mount_devfs": _TRUTH_VARIATIONS,
+    "allow_mount_fusefs": _TRUTH_VARIATIONS,
+    "allow_mount_nullfs": _TRUTH_VARIATIONS,
+    "allow_mount_procfs": _TRUTH_VARIATIONS,
+    "allow_mount_tmpfs": _TRUTH_VARIATIONS,
+    "allow_mount_zfs": _TRUTH_VARIATIONS,
+    "allow_quotas": _TRUTH_VARIATIONS,
+    "allow_socket_af": _TRUTH_VARIATIONS,
+    "allow_vmm": _TRUTH_VARIATIONS,
+    "vnet_interfaces": ("string", ),
+    # RCTL limits
+    "cpuset": ('string',),
+    "rlimits": ("off", "on"),
+    "memoryuse": ('string',),
+    "memorylocked": ('string',),
+    "vmemoryuse": ('string',),
+    "maxproc": ('string',),
+    "cputime": ('string',),
+    "pcpu": ('string',),
+    "datasize": ('string',),
+    "stacksize": ('string',),
+    "coredumpsize": ('string',),
+    "openfiles": ('string',),
+    "pseudoterminals": ('string',),
+    "swapuse": ('string',),
+    "nthr": ('string',),
+    "msgqqueued": ('string',),
+    "msgqsize": ('string',),
+    "nmsgq": ('string',),
+    "nsem": ('string',),
+    "nsemop": ('string',),
+    "nshm": ('string',),
+    "shmsize": ('string',),
+    "wallclock": ('string',),
+    "readbps": ('string',),
+    "writebps": ('string',),
+    "readiops": ('string',),
+    "writeiops": ('string',),
+    # Custom properties
+    "bpf": _TRUTH_VARIATIONS,
+    "dhcp": _TRUTH_VARIATIONS,
+    "boot": _TRUTH_VARIATIONS,
+    "notes": ("string", ),
+    "owner": ("string", ),
+    "priority": _PRIORITY_VALUES,
+    "hostid": ("string", ),
+    "hostid_strict_check": _TRUTH_VARIATIONS,
+    "jail_zfs": _TRUTH_VARIATIONS,
+    "jail_zfs_dataset": ("string", ),
+    "jail_zfs_mountpoint": ("string", ),
+    "mount_procfs": _TRUTH_VARIATIONS,
+    "mount_linprocfs": _TRUTH_VARIATIONS,
+    "vnet": _TRUTH_VARIATIONS,
+    "vnet_default_interface": ("string",),
+    "template": _TRUTH_VARIATIONS,
+    "comment": ("string", ),
+    "host_time": _TRUTH_VARIATIONS,
+    "depends": ("string", ),
+    "allow_tun": _TRUTH_VARIATIONS,
+    'rtsold': _TRUTH_VARIATIONS,
+    'ip_hostname': _TRUTH_VARIATIONS,
+    'assign_localhost': _TRUTH_VARIATIONS,
+    'localhost_ip': ('string', ),
+    'nat': _TRUTH_VARIATIONS,
+    'nat_prefix': ('string', ),
+    'nat_interface': ('string', ),
+    'nat_backend': ('pf', 'ipfw'),
+    'nat_forwards': ('string', ),
+    'plugin_name': ('string', ),
+    'plugin_repository': ('string', ),
+    'min_dyn_devfs_ruleset': ('string', ),
+    "vnet0_mtu": ("string", ),
+    "vnet1_mtu": ("string", ),
+    "vnet2_mtu": ("string", ),
+    "vnet3_mtu": ("string", ),
+    "vnet_default_mtu": ("string", ),
+}
+
+_ZFS_PROPS = {
+    # ZFS Props
+    "compression": "lz4",
+    "origin": "readonly",
+    "quota": "none",
+    "mountpoint": "readonly",
+    "compressratio": "readonly",
+    "available": "readonly",
+    "used": "readonly",
+    "dedup": "off",
+    "reservation": "none",
+}
+
+_VNET_MAC_KEYS = frozenset(f'vnet{i}_mac' for i in range(0, 4))
+
+# Jail parameters whose name only has its first underscore turned into a
+# period, e.g. allow_set_hostname -> allow.set_hostname
+_SINGLE_PERIOD_PROPS = frozenset((
+    "allow_raw_sockets", "allow_socket_af", "allow_set_hostname"
+))
+
+# Loose shape of the dates old iocage versions used as tags, anything not
+# matching this can't be parsed as one
+_DATE_RE = re.compile(
+    r'^\d{4}-\d{1,2}-[ \d]?\d@\d{1,2}:\d{1,2}:\d{1,2}(:\d{1,6})?$'
+)
+
+_MAC_RE = re.compile(r'[0-9a-f]{2}([-:]?)[0-9a-f]{2}(\1[0-9a-f]{2}){4}$')
+
+
+def _replace_in_file(path, old, new):
+    # Small config files are rewritten in one go instead of line by line
+    with open(path, 'r') as f:
+        data = f.read()
+
+    with iocage_lib.ioc_common.open_atomic(path, 'w') as f:
+        f.write(data.replace(old, new))
+
+
+def _mount_and_promote(dataset, to_mount, max_workers=8):
+    # Every dataset is promoted but only those in to_mount are mounted, a
+    # jailed data dataset must not end up mounted on the host. Each level is
+    # done concurrently, a child can only be mounted once its parent is.
+    # One listing gives whether they are mounted, as every mount resets the
+    # cache
+    levels = collections.defaultdict(list)
+    for name, mounted in get_mounted_dependents(dataset):
+        levels[name.count('/')].append(
+            (Dataset(name, cache=False), name in to_mount and not mounted)
+        )
+
+    def mount_and_promote(ds_and_mount):
+        ds, mount = ds_and_mount
+        if mount:
+            ds.mount()
+        ds.promote()
+
+    for depth in sorted(levels):
+        if len(levels[depth]) == 1:
+            mount_and_promote(levels[depth][0])
+            continue
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as exc:
+            list(exc.map(mount_and_promote, levels[depth]))
+
+
+# A missing /etc/hostid is remembered as well, so it isn't looked up again
+@functools.lru_cache(maxsize=1)
+def _read_hostid():
+    try:
+        with open('/etc/hostid', 'r') as _file:
+            return _file.read().strip()
+    except OSError:
+        return None
+
+
+# The host's interfaces and routes are looked up from the kernel on every
+# netifaces call. Lookups made within a few seconds of each other share a
+# result, long running API users still see bridges and routes added later.
+_NETIFACES_TTL = 2
+
+
+def _netifaces_epoch():
+    return int(time.monotonic() // _NETIFACES_TTL)
+
+
+@functools.lru_cache(maxsize=1)
+def _interfaces(epoch):
+    return frozenset(netifaces.interfaces())
+
+
+@functools.lru_cache(maxsize=1)
+def _gateways(epoch):
+    return netifaces.gateways()
+
+
+def _cached_interfaces():
+    return _interfaces(_netifaces_epoch())
+
+
+def _cached_gateways():
+    return _gateways(_netifaces_epoch())
 
 
 class JailRuntimeConfiguration(object):
@@ -393,7 +878,7 @@ class IOCRCTL(object):
                             f'with {prop}'
                         }
                     )
-                action = value.split('=')[0]
+                action = value.split('=', 1)[0]
                 if action == 'deny' and prop in (
                     'cputime', 'wallclock', 'readbps', 'writebps',
                     'readiops', 'writeiops'
@@ -420,6 +905,7 @@ class IOCRCTL(object):
 
 
 class IOCConfiguration:
+
     def __init__(self, location, checking_datasets, silent, callback):
         self.location = location
         self.silent = silent
@@ -438,6 +924,14 @@ class IOCConfiguration:
 
         return version
 
+    @staticmethod
+    def get_hostid():
+        """
+        Returns the host's hostid or None if it has none, it is only read
+        once per process.
+        """
+        return _read_hostid()
+
     def get_pool_and_iocroot(self):
         """For internal getting of pool and iocroot."""
         def get_pool():
@@ -447,11 +941,24 @@ class IOCConfiguration:
             #  issued already ( keeping old behavior )
             # 3) Only activate if pool is not freenas-boot/boot-pool and
             # iocage skip is false
+            activating = len(sys.argv) >= 2 and 'activate' in sys.argv[1:]
+            if iocage_cache.config_pool and not activating:
+                # Any property change on a pool resets the cache, so a pool
+                # resolved earlier in this process is still the right one
+                return iocage_cache.config_pool
+
             old = False
             matches = []
-            zpools = [pool for pool in PoolListableResource() if not pool.root_dataset.locked]
-            for pool in zpools:
-                if pool.active:
+            zpools = []
+            for pool in PoolListableResource():
+                # Read the root dataset properties once per pool instead of
+                # building a new Dataset for each property we look at
+                root_dataset = pool.root_dataset
+                if root_dataset.locked:
+                    continue
+
+                zpools.append(pool)
+                if root_dataset.properties.get(IOCAGE_POOL_PROP) == 'yes':
                     matches.append(pool)
                 elif pool.properties.get('comment') == 'iocage':
                     matches.append(pool)
@@ -461,6 +968,7 @@ class IOCConfiguration:
                 if old:
                     matches[0].activate_pool()
 
+                iocage_cache.config_pool = matches[0].name
                 return matches[0].name
 
             elif len(matches) > 1:
@@ -478,7 +986,7 @@ class IOCConfiguration:
                                    f'Run \"iocage  activate ZPOOL\" '
                                    f'on the preferred pool.\n')
             else:
-                if len(sys.argv) >= 2 and "activate" in sys.argv[1:]:
+                if activating:
                     pass
                 else:
                     # We use the first zpool the user has, they are free to
@@ -548,17 +1056,23 @@ class IOCConfiguration:
 
                     zpool.activate_pool()
 
+                    iocage_cache.config_pool = zpool.name
                     return zpool.name
 
         pool = get_pool()
 
         def get_iocroot():
+            if iocage_cache.config_iocroot and \
+                    iocage_cache.config_pool == pool:
+                return iocage_cache.config_iocroot
+
             loc = Dataset(os.path.join(pool, 'iocage'))
 
             if not loc.exists:
                 # It's okay, ioc check would create datasets
                 return ''
             elif loc.mounted:
+                iocage_cache.config_iocroot = loc.path
                 return loc.path
             else:
                 iocage_lib.ioc_common.logit(
@@ -574,7 +1088,7 @@ class IOCConfiguration:
     @staticmethod
     def get_mac_prefix():
         try:
-            default_gw = netifaces.gateways()['default'][netifaces.AF_INET][1]
+            default_gw = _cached_gateways()['default'][netifaces.AF_INET][1]
             default_mac = netifaces.ifaddresses(default_gw)[netifaces.AF_LINK]
 
             # Use the hosts prefix to start generation from.
@@ -618,6 +1132,27 @@ class IOCConfiguration:
             valid = binary[7] == '0' and binary[6] == '1'
         return valid
 
+    @staticmethod
+    def json_read(path):
+        """
+        Read the JSON file at path, reusing the previous parse if the file
+        has not changed on disk since.
+        """
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = _CONFIG_CACHE.get(path)
+
+        if cached and cached[0] == stamp:
+            conf = cached[1]
+        else:
+            with open(path, 'rb') as f:
+                data = f.read()
+            conf = _json_loads(data)
+            _CONFIG_CACHE[path] = (stamp, conf)
+
+        # Callers are free to set keys on what we return
+        return copy.copy(conf)
+
     def json_write(self, data, _file="/config.json", defaults=False):
         """Write a JSON file at the location given with supplied data."""
         # Templates need to be set r/w and then back to r/o
@@ -646,10 +1181,16 @@ class IOCConfiguration:
                     exception=ioc_exceptions.CommandFailed
                 )
 
+        _CONFIG_CACHE.pop(write_location, None)
+
         try:
-            with iocage_lib.ioc_common.open_atomic(write_location, 'w') as out:
-                json.dump(data, out, sort_keys=True, indent=4,
-                          ensure_ascii=False)
+            # Serialize up front so the file gets a single write() instead
+            # of the many small chunks json.dump emits
+            buf = _json_dumps(data)
+            with iocage_lib.ioc_common.open_atomic(
+                write_location, 'wb'
+            ) as out:
+                out.write(buf)
         except Exception:
             raise FileNotFoundError(write_location)
 
@@ -781,77 +1322,16 @@ class IOCConfiguration:
 
         conf['CONFIG_VERSION'] = iocage_conf_version
 
-        # Version 2 keys
-        if not conf.get('sysvmsg'):
-            conf['sysvmsg'] = 'new'
-        if not conf.get('sysvsem'):
-            conf['sysvsem'] = 'new'
-        if not conf.get('sysvshm'):
-            conf['sysvshm'] = 'new'
-
-        # Version 4 keys
-        if not conf.get('basejail'):
-            conf['basejail'] = 0
-
-        # Version 5 keys
-        if not conf.get('comment'):
-            conf['comment'] = 'none'
-
-        # Version 6 keys
-        if not conf.get('host_time'):
-            conf['host_time'] = 1
-
-        # Version 7 keys
-        if not conf.get('depends'):
-            conf['depends'] = 'none'
-
-        # Version 9 keys
-        if not conf.get('dhcp'):
-            conf['dhcp'] = 0
-        if not conf.get('bpf'):
-            conf['bpf'] = 0
-
-        # Version 10 keys
-        if not conf.get('vnet_interfaces'):
-            conf['vnet_interfaces'] = 'none'
-
-        # Version 11 keys
-        if not conf.get('hostid_strict_check'):
-            conf['hostid_strict_check'] = 0
-
-        # Version 12 keys
-        if not conf.get('allow_mlock'):
-            conf['allow_mlock'] = 0
-
-        # Version 13 keys
-        if not conf.get('vnet_default_interface'):
-            conf['vnet_default_interface'] = 'auto'
-        else:
-            # Catch all users migrating from old prop value of none, which
-            # meant auto
-            if current_conf_version in ('12', '13') \
-                    and conf['vnet_default_interface'] == 'none':
-                conf['vnet_default_interface'] = 'auto'
-
-        # Version 14 keys
-        if not conf.get('allow_tun'):
-            conf['allow_tun'] = 0
-
-        # Version 15 keys
-        if not conf.get('allow_mount_fusefs'):
-            conf['allow_mount_fusefs'] = 0
-
-        # Version 16 keys
-        if not conf.get('rtsold'):
-            conf['rtsold'] = 0
-
-        # Version 17 keys
-        if not conf.get('allow_vmm'):
-            conf['allow_vmm'] = 0
+        # Keys added over the versions which only need a default when unset
+        for key, value in _CONFIG_KEY_DEFAULTS.items():
+            if not conf.get(key):
+                conf[key] = value
 
-        # Version 18 keys
-        if not conf.get('ip_hostname'):
-            conf['ip_hostname'] = 0
+        # Version 13: catch all users migrating from old prop value of none,
+        # which meant auto
+        if current_conf_version in ('12', '13') \
+                and conf['vnet_default_interface'] == 'none':
+            conf['vnet_default_interface'] = 'auto'
 
         # Version 19 keys
         # RCTL Support added
@@ -859,55 +1339,12 @@ class IOCConfiguration:
             {k: 'off' for k in IOCRCTL.types if not conf.get(k)}
         )
 
-        # Version 20 keys
-        if not conf.get('exec_created'):
-            conf['exec_created'] = '/usr/bin/true'
-
-        # Version 21 keys
-        if not conf.get('assign_localhost'):
-            conf['assign_localhost'] = 0
-
-        # Version 22 keys
-        if not conf.get('localhost_ip'):
-            conf['localhost_ip'] = 'none'
-
-        # Version 23 keys
-        if not conf.get('nat'):
-            conf['nat'] = 0
-        if not conf.get('nat_prefix'):
-            conf['nat_prefix'] = '172.16'
-        if not conf.get('nat_interface'):
-            conf['nat_interface'] = 'none'
-        if not conf.get('nat_backend'):
-            conf['nat_backend'] = 'ipfw'
-        if not conf.get('nat_forwards'):
-            conf['nat_forwards'] = 'none'
-
-        # Version 24 key
-        if not conf.get('plugin_name'):
-            conf['plugin_name'] = 'none'
-
-        # Version 25 key
-        if not conf.get('plugin_repository'):
-            conf['plugin_repository'] = 'none'
-
         # Version 26 keys
         # Migrate defaultrouter and defaultrouter6 default 'none' to 'auto'
         for option in ('defaultrouter', 'defaultrouter6'):
             if conf.get(option) == 'none':
                 conf[option] = 'auto'
 
-        # Version 27 key
-        if not conf.get('min_dyn_devfs_ruleset'):
-            conf['min_dyn_devfs_ruleset'] = '1000'
-
-        # Version 28 keys
-        for x in range(0, 4):
-            if not conf.get(f"vnet{x}_mtu"):
-                conf[f"vnet{x}_mtu"] = 'auto'
-        if not conf.get("vnet_default_mtu"):
-            conf["vnet_default_mtu"] = '1500'
-
         if not default:
             conf.update(jail_conf)
 
@@ -915,24 +1352,24 @@ class IOCConfiguration:
 
     def backup_iocage_jail_conf(self, location):
         if os.path.exists(location):
-            dest = location.rsplit('/', 1)[-1].replace('.json', '')
+            parent, dest = os.path.split(location)
+            dest = dest.replace('.json', '')
             shutil.copy(
-                location, os.path.join(
-                    location.rsplit('/', 1)[0], f'{dest}_backup.json'
-                )
+                location, os.path.join(parent, f'{dest}_backup.json')
             )
 
     def check_jail_config(self, conf):
         """
         Checks the jails configuration and migrates anything needed
         """
+        original_conf = conf.copy()
         release = conf.get('release', None)
         template = conf.get('template', 0)
         host_hostuuid = conf.get('host_hostuuid', None)
         renamed = False
 
         if release is None or host_hostuuid is None:
-            err_name = self.location.rsplit('/', 1)[-1]
+            err_name = os.path.basename(self.location)
             iocage_lib.ioc_common.logit(
                 {
                     'level': 'EXCEPTION',
@@ -947,7 +1384,7 @@ class IOCConfiguration:
 
         if iocage_lib.ioc_common.check_truthy(template):
             freebsd_version_path = \
-                f'{self.iocroot}/templates/{conf["host_hostuuid"]}/root'
+                f'{self.iocroot}/templates/{host_hostuuid}/root'
         else:
             freebsd_version_path = f'{self.iocroot}/jails/{host_hostuuid}/root'
 
@@ -955,24 +1392,26 @@ class IOCConfiguration:
             f'{freebsd_version_path}/bin/freebsd-version'
         )
 
-        if not freebsd_version.is_file() and conf.get('basejail'):
+        version_found = freebsd_version.is_file()
+        if not version_found and conf.get('basejail'):
             # It is possible the basejail hasn't started yet. I believe
             # the best case here is to parse fstab entries and determine
             # which release is being used and check it for freebsd-version
             fstab = iocage_lib.ioc_fstab.IOCFstab(host_hostuuid, 'list')
             fstab.__validate_fstab__([l[1] for l in fstab.fstab], 'all')
+            bin_path = os.path.join(freebsd_version_path, 'bin')
             for index, fstab_entry in fstab.fstab_list():
-                if fstab_entry[1].rstrip('/') == os.path.join(
-                    freebsd_version_path, 'bin'
-                ):
+                if fstab_entry[1].rstrip('/') == bin_path:
                     freebsd_version = pathlib.Path(
                         os.path.join(fstab_entry[0], 'freebsd-version')
                     )
                     freebsd_version_path = fstab_entry[0].rstrip('/').rsplit(
                         '/', 1
                     )[0]
+                    version_found = freebsd_version.is_file()
+                    break
 
-        if not freebsd_version.is_file():
+        if not version_found:
             iocage_lib.ioc_common.logit(
                 {
                     'level': 'EXCEPTION',
@@ -1011,14 +1450,8 @@ class IOCConfiguration:
         # Version 8 migration from uuid to tag named dataset
         try:
             tag = conf['tag']
-            uuid = conf['host_hostuuid']
-
-            try:
-                state = iocage_lib.ioc_common.checkoutput(
-                    ['jls', '-j', f'ioc-{uuid.replace(".", "_")}'],
-                    stderr=su.PIPE).split()[5]
-            except su.CalledProcessError:
-                state = False
+            uuid = host_hostuuid
+            tag_location = f'{self.iocroot}/jails/{tag}'
 
             if tag != uuid:
                 if not self.force:
@@ -1032,6 +1465,14 @@ class IOCConfiguration:
                         _callback=self.callback,
                         silent=self.silent)
 
+                # Only the migration cares whether the jail is running
+                try:
+                    state = iocage_lib.ioc_common.checkoutput(
+                        ['jls', '-j', f'ioc-{uuid.replace(".", "_")}'],
+                        stderr=su.PIPE).split()[5]
+                except su.CalledProcessError:
+                    state = False
+
                 conf, rtrn, date = self.json_migrate_uuid_to_tag(
                     uuid, tag, state, conf)
 
@@ -1041,9 +1482,15 @@ class IOCConfiguration:
                     # The jail's tag was not a date, so it was renamed. Fix
                     # fstab
 
-                    for line in fileinput.input(
-                            f'{self.iocroot}/jails/{tag}/fstab', inplace=1):
-                        print(line.replace(uuid, tag).rstrip())
+                    fstab_path = f'{tag_location}/fstab'
+                    with open(fstab_path, 'r') as f:
+                        fstab = f.read()
+
+                    if uuid in fstab:
+                        with iocage_lib.ioc_common.open_atomic(
+                            fstab_path, 'w'
+                        ) as f:
+                            f.write(fstab.replace(uuid, tag))
 
                     renamed = True
 
@@ -1057,200 +1504,54 @@ class IOCConfiguration:
             pass
 
         try:
-            if not renamed:
+            # Nothing to migrate is the common case, don't rewrite the file
+            if not renamed and conf != original_conf:
                 self.json_write(conf)
         except FileNotFoundError:
             # Dataset was renamed.
-            self.location = f'{self.iocroot}/jails/{tag}'
+            self.location = tag_location
 
             self.json_write(conf)
-            messages = collections.OrderedDict(
-                [('1-NOTICE', '*' * 80),
-                 ('2-WARNING', f'Jail: {uuid} was renamed to {tag}'),
-                 ('3-NOTICE', f'{"*" * 80}\n'),
-                 ('4-EXCEPTION', 'Please issue your command again.')]
-            )
-
-            for level, msg in messages.items():
-                level = level.partition('-')[2]
-
-                iocage_lib.ioc_common.logit(
-                    {
-                        'level': level,
-                        'message': msg
-                    },
-                    _callback=self.callback,
-                    silent=self.silent)
+            self.log_jail_renamed(uuid, tag)
 
         # The above doesn't get triggered with legacy short UUIDs
         if renamed:
-            self.location = f'{self.iocroot}/jails/{tag}'
+            self.location = tag_location
 
             self.json_write(conf)
 
-            messages = collections.OrderedDict(
-                [('1-NOTICE', '*' * 80),
-                 ('2-WARNING', f'Jail: {uuid} was renamed to {tag}'),
-                 ('3-NOTICE', f'{"*" * 80}\n'),
-                 ('4-EXCEPTION', 'Please issue your command again.')]
-            )
-
-            for level, msg in messages.items():
-                level = level.partition('-')[2]
-
-                iocage_lib.ioc_common.logit(
-                    {
-                        'level': level,
-                        'message': msg
-                    },
-                    _callback=self.callback,
-                    silent=self.silent)
+            self.log_jail_renamed(uuid, tag)
         return conf
 
+    def log_jail_renamed(self, old_name, new_name):
+        """Tells the user a jail was renamed and stops the command."""
+        for level, msg in _RENAME_MESSAGES:
+            iocage_lib.ioc_common.logit(
+                {
+                    'level': level,
+                    'message': msg.format(old=old_name, new=new_name)
+                },
+                _callback=self.callback,
+                silent=self.silent)
+
     @staticmethod
     def retrieve_default_props():
-        try:
-            with open('/etc/hostid', 'r') as _file:
-                hostid = _file.read().strip()
-        except Exception:
-            hostid = None
+        # The hostid won't change while we are running, the mac prefix
+        # follows the host's default gateway so it is looked up every time
+        version = IOCConfiguration.get_version()
+        if version not in _DEFAULTS_CACHE:
+            _DEFAULTS_CACHE[version] = {
+                **_GLOBAL_DEFAULT_PROPS,
+                'CONFIG_VERSION': version,
+                'hostid': IOCConfiguration.get_hostid(),
+                'devfs_ruleset': str(
+                    iocage_lib.ioc_common.IOCAGE_DEVFS_RULESET
+                ),
+            }
+
         return {
-            'CONFIG_VERSION': IOCConfiguration.get_version(),
-            'interfaces': 'vnet0:bridge0',
-            'host_domainname': 'none',
-            'exec_fib': '0',
-            'ip4_addr': 'none',
-            'ip4_saddrsel': '1',
-            'ip4': 'new',
-            'ip6_addr': 'none',
-            'ip6_saddrsel': '1',
-            'ip6': 'new',
-            'defaultrouter': 'auto',
-            'defaultrouter6': 'auto',
-            'resolver': '/etc/resolv.conf',
+            **_DEFAULTS_CACHE[version],
             'mac_prefix': IOCConfiguration.get_mac_prefix(),
-            'vnet0_mac': 'none',
-            'vnet1_mac': 'none',
-            'vnet2_mac': 'none',
-            'vnet3_mac': 'none',
-            'vnet_default_interface': 'auto',
-            'devfs_ruleset': str(iocage_lib.ioc_common.IOCAGE_DEVFS_RULESET),
-            'exec_start': '/bin/sh /etc/rc',
-            'exec_stop': '/bin/sh /etc/rc.shutdown',
-            'exec_prestart': '/usr/bin/true',
-            'exec_poststart': '/usr/bin/true',
-            'exec_prestop': '/usr/bin/true',
-            'exec_poststop': '/usr/bin/true',
-            'exec_created': '/usr/bin/true',
-            'exec_clean': 1,
-            'exec_timeout': '60',
-            'stop_timeout': '30',
-            'exec_jail_user': 'root',
-            'exec_system_jail_user': '0',
-            'exec_system_user': 'root',
-            'mount_devfs': 1,
-            'mount_fdescfs': 1,
-            'enforce_statfs': '2',
-            'children_max': '0',
-            'login_flags': '-f root',
-            'securelevel': '2',
-            'sysvmsg': 'new',
-            'sysvsem': 'new',
-            'sysvshm': 'new',
-            'allow_set_hostname': 1,
-            'allow_sysvipc': 0,
-            'allow_raw_sockets': 0,
-            'allow_chflags': 0,
-            'allow_mlock': 0,
-            'allow_mount': 0,
-            'allow_mount_devfs': 0,
-            'allow_mount_fusefs': 0,
-            'allow_mount_nullfs': 0,
-            'allow_mount_procfs': 0,
-            'allow_mount_tmpfs': 0,
-            'allow_mount_zfs': 0,
-            'allow_quotas': 0,
-            'allow_socket_af': 0,
-            'allow_tun': 0,
-            'allow_vmm': 0,
-            'cpuset': 'off',
-            'rlimits': 'off',
-            'memoryuse': 'off',
-            'memorylocked': 'off',
-            'vmemoryuse': 'off',
-            'maxproc': 'off',
-            'cputime': 'off',
-            'pcpu': 'off',
-            'datasize': 'off',
-            'stacksize': 'off',
-            'coredumpsize': 'off',
-            'openfiles': 'off',
-            'pseudoterminals': 'off',
-            'swapuse': 'off',
-            'nthr': 'off',
-            'msgqqueued': 'off',
-            'msgqsize': 'off',
-            'nmsgq': 'off',
-            'nsem': 'off',
-            'nsemop': 'off',
-            'nshm': 'off',
-            'shmsize': 'off',
-            'wallclock': 'off',
-            'readbps': 'off',
-            'writebps': 'off',
-            'readiops': 'off',
-            'writeiops': 'off',
-            'type': 'jail',
-            'bpf': 0,
-            'dhcp': 0,
-            'boot': 0,
-            'notes': 'none',
-            'owner': 'root',
-            'priority': '99',
-            'last_started': 'none',
-            'template': 0,
-            'hostid': hostid,
-            'hostid_strict_check': 0,
-            'jail_zfs': 0,
-            'jail_zfs_mountpoint': 'none',
-            'mount_procfs': 0,
-            'mount_linprocfs': 0,
-            'count': '1',
-            'vnet': 0,
-            'basejail': 0,
-            'comment': 'none',
-            'host_time': 1,
-            'sync_state': 'none',
-            'sync_target': 'none',
-            'sync_tgt_zpool': 'none',
-            'compression': 'lz4',
-            'origin': 'readonly',
-            'quota': 'none',
-            'mountpoint': 'readonly',
-            'compressratio': 'readonly',
-            'available': 'readonly',
-            'used': 'readonly',
-            'dedup': 'off',
-            'reservation': 'none',
-            'depends': 'none',
-            'vnet_interfaces': 'none',
-            'rtsold': 0,
-            'ip_hostname': 0,
-            'assign_localhost': 0,
-            'localhost_ip': 'none',
-            'nat': 0,
-            'nat_prefix': '172.16',
-            'nat_interface': 'none',
-            'nat_backend': 'ipfw',
-            'nat_forwards': 'none',
-            'plugin_name': 'none',
-            'plugin_repository': 'none',
-            'min_dyn_devfs_ruleset': '1000',
-            'vnet0_mtu': 'auto',
-            'vnet1_mtu': 'auto',
-            'vnet2_mtu': 'auto',
-            'vnet3_mtu': 'auto',
-            'vnet_default_mtu': '1500',
         }
 
     def check_default_config(self):
@@ -1262,11 +1563,10 @@ class IOCConfiguration:
         default_props = self.retrieve_default_props()
 
         try:
-            with open(default_json_location, 'r') as default_json:
-                default_props = json.load(default_json)
-                default_props, write = self.check_config(
-                    default_props, default=True)
-                fix_write = self.fix_properties(default_props)
+            default_props = self.json_read(default_json_location)
+            default_props, write = self.check_config(
+                default_props, default=True)
+            fix_write = self.fix_properties(default_props)
         except FileNotFoundError:
             iocage_lib.ioc_common.logit(
                 {
@@ -1357,6 +1657,10 @@ class IOCJson(IOCConfiguration):
         'nat_backend',
     ]
 
+    # Jail parameters supported by the running kernel, these can't change
+    # while we are running
+    _jail_params = None
+
     def __init__(self,
                  location="",
                  silent=False,
@@ -1371,15 +1675,24 @@ class IOCJson(IOCConfiguration):
         self.suppress_log = suppress_log
         super().__init__(location, checking_datasets, silent, callback)
 
-        try:
-            force_env = os.environ["IOCAGE_FORCE"]
-        except KeyError:
-            # FreeNAS or an API user, due to the sheer web of calls to this
-            # module we are assuming they are OK with any renaming operations
+        # Unset means FreeNAS or an API user, due to the sheer web of calls to
+        # this module we are assuming they are OK with any renaming operations
+        self.force = os.environ.get("IOCAGE_FORCE", "TRUE") == "TRUE"
 
-            force_env = "TRUE"
+    @classmethod
+    def get_jail_params(cls):
+        """Returns the jail parameters that can be set on a running jail."""
+        if cls._jail_params is None:
+            sysctls_list = su.Popen(
+                ["sysctl", "-d", "security.jail.param"],
+                stdout=su.PIPE).communicate()[0].decode("utf-8").split()
+            prefix = "security.jail.param."
+            cls._jail_params = frozenset(
+                p[len(prefix):].rstrip(":")
+                for p in sysctls_list if p.startswith(prefix)
+            )
 
-        self.force = True if force_env == "TRUE" else False
+        return cls._jail_params
 
     def get_full_config(self):
         d_conf = self.default_config
@@ -1405,17 +1718,12 @@ class IOCJson(IOCConfiguration):
             raise RuntimeError("You need to be root to convert the"
                                " configurations to the new format!")
 
-        with open(self.location + "/config", "r") as conf:
-            lines = conf.readlines()
-
-        key_and_value = {}
+        with open(self.location + "/config", "rb") as conf:
+            data = conf.read().translate(None, _UCL_DELETE_CHARS)
 
-        for line in lines:
-            line = line.partition("=")
-            key = line[0].rstrip()
-            value = line[2].replace(";", "").replace('"', '').strip()
-
-            key_and_value[key] = value
+        key_and_value = {
+            k.decode(): v.decode() for k, v in _UCL_RE.findall(data)
+        }
 
         self.json_write(key_and_value)
 
@@ -1428,20 +1736,21 @@ class IOCJson(IOCConfiguration):
             raise RuntimeError("You need to be root to convert the"
                                " configurations to the new format!")
 
+        # These come from the properties of the whole iocage dataset tree that
+        # the cache fetched with a single zfs get, values are plain strings.
         props = Dataset(dataset).properties
 
         # Filter the props we want to convert.
-        prop_prefix = "org.freebsd.iocage"
+        prop_prefix = "org.freebsd.iocage:"
 
         key_and_value = {"host_domainname": "none"}
 
-        for key, prop in props.items():
+        for key, value in props.items():
 
             if not key.startswith(prop_prefix):
                 continue
 
-            key = key.partition(":")[2]
-            value = prop.value
+            key = key[len(prop_prefix):]
 
             if key == "type":
                 if value == "basejail":
@@ -1449,7 +1758,7 @@ class IOCJson(IOCConfiguration):
                     value = "jail"
                     key_and_value["basejail"] = 1
             elif key == "hostname":
-                hostname = props[f'{prop_prefix}:host_hostname']
+                hostname = props.get(f'{prop_prefix}host_hostname')
 
                 if value != hostname:
                     # This is safe to replace at this point.
@@ -1457,7 +1766,7 @@ class IOCJson(IOCConfiguration):
                     # it to the right one now.
 
                     if hostname == uuid:
-                        key_and_value["host_hostname"] = prop.value
+                        key_and_value["host_hostname"] = value
 
                 continue
 
@@ -1508,12 +1817,13 @@ class IOCJson(IOCConfiguration):
 
         skip = False
 
-        if not jail_dataset.mounted:
+        # A mounted location is the common case, a stat is enough to tell
+        # without asking zfs for the dataset properties
+        if not os.path.ismount(self.location) and not jail_dataset.mounted:
             jail_dataset.mount()
 
         try:
-            with open(self.location + "/config.json", "r") as conf:
-                conf = json.load(conf)
+            conf = self.json_read(self.location + "/config.json")
         except json.decoder.JSONDecodeError:
             iocage_lib.ioc_common.logit(
                 {
@@ -1561,8 +1871,7 @@ class IOCJson(IOCConfiguration):
             if os.path.isfile(self.location + "/config"):
                 self.json_convert_from_ucl()
 
-                with open(self.location + "/config.json", "r") as conf:
-                    conf = json.load(conf)
+                conf = self.json_read(self.location + "/config.json")
             else:
                 try:
                     dataset = self.location.split("/")
@@ -1585,9 +1894,7 @@ class IOCJson(IOCConfiguration):
                             )
 
                             self.json_convert_from_zfs(full_uuid)
-                            with open(self.location + "/config.json",
-                                      "r") as conf:
-                                conf = json.load(conf)
+                            conf = self.json_read(self.location + "/config.json")
 
                             iocage_lib.ioc_common.logit(
                                 {
@@ -1668,29 +1975,10 @@ class IOCJson(IOCConfiguration):
                             silent=self.silent)
 
                     self.json_convert_from_zfs(uuid, skip=skip)
-                    with open(self.location + "/config.json", "r") as conf:
-                        conf = json.load(conf)
+                    conf = self.json_read(self.location + "/config.json")
 
                     if legacy_short:
-                        messages = collections.OrderedDict(
-                            [("1-NOTICE", "*" * 80),
-                             ("2-WARNING",
-                              f"Jail: {full_uuid} was renamed to {uuid}"),
-                             ("3-NOTICE",
-                              f"{'*' * 80}\n"),
-                             ("4-EXCEPTION",
-                              "Please issue your command again.")])
-
-                        for level, msg in messages.items():
-                            level = level.partition("-")[2]
-
-                            iocage_lib.ioc_common.logit(
-                                {
-                                    "level": level,
-                                    "message": msg
-                                },
-                                _callback=self.callback,
-                                silent=self.silent)
+                        self.log_jail_renamed(full_uuid, uuid)
                 except su.CalledProcessError:
                     # At this point it should be a real misconfigured jail
                     raise RuntimeError("Configuration is missing!"
@@ -1723,25 +2011,25 @@ class IOCJson(IOCConfiguration):
             return self.get_full_config()
         else:
             conf, write = self.json_load()
-            state, _ = iocage_lib.ioc_list.IOCList().list_get_jid(
-                conf['host_hostuuid'])
 
             if prop == "last_started" and conf[prop] == "none":
                 return "never"
-            elif prop == 'devfs_ruleset' and state:
-                ruleset = su.check_output(
-                    [
-                        'jls', '-j', f'ioc-{conf["host_hostuuid"]}',
-                        'devfs_ruleset'
-                    ]
-                ).decode().rstrip()
-
-                return ruleset
-            else:
+            elif prop == 'devfs_ruleset':
+                # A running jail reports the ruleset it actually got, jls
+                # failing tells us it isn't running without asking twice
+                uuid = conf['host_hostuuid'].replace('.', '_')
                 try:
-                    return conf[prop]
-                except KeyError:
-                    return self.default_config[prop]
+                    return su.check_output(
+                        ['jls', '-j', f'ioc-{uuid}', 'devfs_ruleset'],
+                        stderr=su.PIPE
+                    ).decode().rstrip()
+                except su.CalledProcessError:
+                    pass
+
+            try:
+                return conf[prop]
+            except KeyError:
+                return self.default_config[prop]
 
     def json_set_value(self, prop, _import=False, default=False):
         """Set a property for the specified jail."""
@@ -1756,19 +2044,6 @@ class IOCJson(IOCConfiguration):
                 conf[key] = iocage_lib.ioc_common.check_truthy(value)
             else:
                 conf[key] = value
-            sysctls_cmd = ["sysctl", "-d", "security.jail.param"]
-            jail_param_regex = re.compile("security.jail.param.")
-            sysctls_list = su.Popen(
-                sysctls_cmd,
-                stdout=su.PIPE).communicate()[0].decode("utf-8").split()
-            jail_params = [
-                p.replace("security.jail.param.", "").replace(":", "")
-
-                for p in sysctls_list if re.match(jail_param_regex, p)
-            ]
-            single_period = [
-                "allow_raw_sockets", "allow_socket_af", "allow_set_hostname"
-            ]
 
             if key == "template":
                 old_location = f"{self.pool}/iocage/jails/{uuid}"
@@ -1784,23 +2059,23 @@ class IOCJson(IOCConfiguration):
                         _callback=self.callback,
                         silent=self.silent)
 
-                jails = iocage_lib.ioc_list.IOCList("uuid").list_datasets()
-
-                for j in jails:
-                    _uuid = jails[j]
-                    _path = f"{jails[j]}/root"
-                    t_old_path = f"{old_location}/root@{_uuid}"
-                    t_path = f"{new_location}/root@{_uuid}"
+                # Only root datasets cloned from this template matter, so
+                # check origins in the cached properties of the iocage
+                # datasets rather than resolving every jail's mountpoint.
+                parents = (
+                    f"{self.pool}/iocage/jails", f"{self.pool}/iocage/templates"
+                )
 
-                    if _uuid == uuid:
+                for ds_name, ds_props in iocage_cache.datasets.items():
+                    jail_ds, _, leaf = ds_name.rpartition("/")
+                    parent, _, _uuid = jail_ds.rpartition("/")
+                    if leaf != "root" or parent not in parents or \
+                            _uuid == uuid:
                         continue
 
-                    ds = Dataset(_path)
-                    if ds.exists:
-                        origin = ds.properties.get('origin', '-')
-                    else:
-                        # Preserving old behavior
-                        origin = None
+                    t_old_path = f"{old_location}/root@{_uuid}"
+                    t_path = f"{new_location}/root@{_uuid}"
+                    origin = ds_props.get('origin', '-')
 
                     if origin == t_old_path or origin == t_path:
                         _status, _ = iocage_lib.ioc_list.IOCList(
@@ -1833,8 +2108,7 @@ class IOCJson(IOCConfiguration):
 
                     conf["type"] = "template"
 
-                    self.location = new_location.lstrip(self.pool).replace(
-                        "/iocage", self.iocroot)
+                    self.location = f"{self.iocroot}/templates/{uuid}"
 
                     iocage_lib.ioc_common.logit(
                         {
@@ -1856,8 +2130,7 @@ class IOCJson(IOCConfiguration):
                         ds = Dataset(new_location)
                         ds.rename(old_location, {'force_unmount': True})
                         conf["type"] = "jail"
-                        self.location = old_location.lstrip(self.pool).replace(
-                            "/iocage", self.iocroot)
+                        self.location = f"{self.iocroot}/jails/{uuid}"
                         ds.set_property('readonly', 'off')
 
                         self.json_check_prop(key, value, conf, default)
@@ -1873,7 +2146,7 @@ class IOCJson(IOCConfiguration):
 
                     return
 
-            if key[:8] == "jail_zfs" or key == 'dhcp':
+            if key.startswith("jail_zfs") or key == 'dhcp':
                 if status:
                     iocage_lib.ioc_common.logit(
                         {
@@ -1883,8 +2156,8 @@ class IOCJson(IOCConfiguration):
                         },
                         _callback=self.callback,
                         silent=self.silent)
-            if write:
-                self.json_write(conf)
+            # Any migration json_load did is saved along with the new value
+            # below, writing here as well would rewrite the file twice
         else:
             conf = self.default_config
 
@@ -1908,7 +2181,7 @@ class IOCJson(IOCConfiguration):
             # We can attempt to set a property in realtime to jail.
 
             if status:
-                if key in single_period:
+                if key in _SINGLE_PERIOD_PROPS:
                     key = key.replace("_", ".", 1)
                 else:
                     key = key.replace("_", ".")
@@ -1926,7 +2199,7 @@ class IOCJson(IOCConfiguration):
 
                 # Let's set a rctl rule for the prop if applicable
                 if key in IOCRCTL.types:
-                    rctl_jail = IOCRCTL(conf['host_hostuuid'])
+                    rctl_jail = IOCRCTL(uuid)
                     rctl_jail.validate_rctl_tunable()
 
                     if value != 'off':
@@ -1965,15 +2238,14 @@ class IOCJson(IOCConfiguration):
                                 silent=self.silent
                             )
 
-                if key in jail_params:
+                if key in self.get_jail_params():
                     if full_conf['vnet'] and (
                         key == "ip4.addr" or key == "ip6.addr"
                     ):
                         return
 
                     try:
-                        ip = True if key == "ip4.addr" or key == "ip6.addr" \
-                            else False
+                        ip = key in ("ip4.addr", "ip6.addr")
 
                         if ip and value.lower() == "none":
                             return
@@ -2028,151 +2300,6 @@ class IOCJson(IOCConfiguration):
         Checks if the property matches known good values, if it's the
         CLI, deny setting any properties not in this list.
         """
-        truth_variations = (
-            '0', '1', 'off', 'on', 'no', 'yes', 'false', 'true'
-        )
-
-        props = {
-            # Network properties
-            "interfaces": (":", ","),
-            "host_domainname": ("string", ),
-            "host_hostname": ("string", ),
-            "exec_fib": ("string", ),
-            "ip4_addr": ("string", ),
-            "ip4_saddrsel": truth_variations,
-            "ip4": ("new", "inherit", "disable"),
-            "ip6_addr": ("string", ),
-            "ip6_saddrsel": truth_variations,
-            "ip6": ("new", "inherit", "disable"),
-            "defaultrouter": ("string", ),
-            "defaultrouter6": ("string", ),
-            "resolver": ("string", ),
-            "mac_prefix": ("string", ),
-            "vnet0_mac": ("string", ),
-            "vnet1_mac": ("string", ),
-            "vnet2_mac": ("string", ),
-            "vnet3_mac": ("string", ),
-            # Jail Properties
-            "devfs_ruleset": ("string", ),
-            "exec_start": ("string", ),
-            "exec_stop": ("string", ),
-            "exec_prestart": ("string", ),
-            "exec_poststart": ("string", ),
-            "exec_prestop": ("string", ),
-            "exec_poststop": ("string", ),
-            "exec_clean": truth_variations,
-            "exec_created": ("string", ),
-            "exec_timeout": ("string", ),
-            "stop_timeout": ("string", ),
-            "exec_jail_user": ("string", ),
-            "exec_system_jail_user": ("string", ),
-            "exec_system_user": ("string", ),
-            "mount_devfs": truth_variations,
-            "mount_fdescfs": truth_variations,
-            "enforce_statfs": ("0", "1", "2"),
-            "children_max": ("string", ),
-            "login_flags": ("string", ),
-            "securelevel": ("string", ),
-            "sysvmsg": ("new", "inherit", "disable"),
-            "sysvsem": ("new", "inherit", "disable"),
-            "sysvshm": ("new", "inherit", "disable"),
-            "allow_set_hostname": truth_variations,
-            "allow_sysvipc": truth_variations,
-            "allow_raw_sockets": truth_variations,
-            "allow_chflags": truth_variations,
-            "allow_mlock": truth_variations,
-            "allow_mount": truth_variations,
-            "allow_mount_devfs": truth_variations,
-            "allow_mount_fusefs": truth_variations,
-            "allow_mount_nullfs": truth_variations,
-            "allow_mount_procfs": truth_variations,
-            "allow_mount_tmpfs": truth_variations,
-            "allow_mount_zfs": truth_variations,
-            "allow_quotas": truth_variations,
-            "allow_socket_af": truth_variations,
-            "allow_vmm": truth_variations,
-            "vnet_interfaces": ("string", ),
-            # RCTL limits
-            "cpuset": ('string',),
-            "rlimits": ("off", "on"),
-            "memoryuse": ('string',),
-            "memorylocked": ('string',),
-            "vmemoryuse": ('string',),
-            "maxproc": ('string',),
-            "cputime": ('string',),
-            "pcpu": ('string',),
-            "datasize": ('string',),
-            "stacksize": ('string',),
-            "coredumpsize": ('string',),
-            "openfiles": ('string',),
-            "pseudoterminals": ('string',),
-            "swapuse": ('string',),
-            "nthr": ('string',),
-            "msgqqueued": ('string',),
-            "msgqsize": ('string',),
-            "nmsgq": ('string',),
-            "nsem": ('string',),
-            "nsemop": ('string',),
-            "nshm": ('string',),
-            "shmsize": ('string',),
-            "wallclock": ('string',),
-            "readbps": ('string',),
-            "writebps": ('string',),
-            "readiops": ('string',),
-            "writeiops": ('string',),
-            # Custom properties
-            "bpf": truth_variations,
-            "dhcp": truth_variations,
-            "boot": truth_variations,
-            "notes": ("string", ),
-            "owner": ("string", ),
-            "priority": str(tuple(range(1, 100))),
-            "hostid": ("string", ),
-            "hostid_strict_check": truth_variations,
-            "jail_zfs": truth_variations,
-            "jail_zfs_dataset": ("string", ),
-            "jail_zfs_mountpoint": ("string", ),
-            "mount_procfs": truth_variations,
-            "mount_linprocfs": truth_variations,
-            "vnet": truth_variations,
-            "vnet_default_interface": ("string",),
-            "template": truth_variations,
-            "comment": ("string", ),
-            "host_time": truth_variations,
-            "depends": ("string", ),
-            "allow_tun": truth_variations,
-            'rtsold': truth_variations,
-            'ip_hostname': truth_variations,
-            'assign_localhost': truth_variations,
-            'localhost_ip': ('string', ),
-            'nat': truth_variations,
-            'nat_prefix': ('string', ),
-            'nat_interface': ('string', ),
-            'nat_backend': ('pf', 'ipfw'),
-            'nat_forwards': ('string', ),
-            'plugin_name': ('string', ),
-            'plugin_repository': ('string', ),
-            'min_dyn_devfs_ruleset': ('string', ),
-            "vnet0_mtu": ("string", ),
-            "vnet1_mtu": ("string", ),
-            "vnet2_mtu": ("string", ),
-            "vnet3_mtu": ("string", ),
-            "vnet_default_mtu": ("string", ),
-        }
-
-        zfs_props = {
-            # ZFS Props
-            "compression": "lz4",
-            "origin": "readonly",
-            "quota": "none",
-            "mountpoint": "readonly",
-            "compressratio": "readonly",
-            "available": "readonly",
-            "used": "readonly",
-            "dedup": "off",
-            "reservation": "none",
-        }
-
         if key in self.default_only_props:
             if not default:
                 iocage_lib.ioc_common.logit(
@@ -2199,7 +2326,7 @@ class IOCJson(IOCConfiguration):
                     }
                 )
 
-        if key in zfs_props.keys():
+        if key in _ZFS_PROPS:
             if iocage_lib.ioc_common.check_truthy(
                 conf.get('template', '0')
             ):
@@ -2228,10 +2355,10 @@ class IOCJson(IOCConfiguration):
 
             return value, conf
 
-        elif key in props.keys():
+        elif key in _PROPS:
             # Either it contains what we expect, or it's a string.
 
-            if props[key] == truth_variations:
+            if _PROPS[key] == _TRUTH_VARIATIONS:
                 if key in ('nat', 'bpf'):
                     other_key = 'nat' if key == 'bpf' else 'bpf'
                     if (
@@ -2246,11 +2373,18 @@ class IOCJson(IOCConfiguration):
                             }
                         )
 
-            for k in props[key]:
-                if k in value.lower():
+            if key == 'priority':
+                if _PRIORITY_RE.fullmatch(value) and \
+                        int(value) in _PRIORITY_VALUES:
                     return value, conf
-
-            if props[key][0] == 'string':
+            elif _PROPS[key][0] != 'string':
+                # String values are validated per property below, matching
+                # them against "string" would only let some skip that
+                for k in _PROPS[key]:
+                    if k in value.lower():
+                        return value, conf
+
+            if _PROPS[key][0] == 'string':
                 if key in (
                     'ip4_addr', 'ip6_addr'
                 ) and (
@@ -2315,22 +2449,13 @@ class IOCJson(IOCConfiguration):
                             final_value.append(f'{iface}{ip}')
 
                     conf[key] = ','.join(final_value)
-                elif key in [f'vnet{i}_mac' for i in range(0, 4)]:
+                elif key in _VNET_MAC_KEYS:
                     if value and value != 'none':
                         value = value.replace(',', ' ')
-                        rx = \
-                            "[0-9a-f]{2}([-:]?)[0-9a-f]{2}(\\1[0-9a-f]{2}){4}$"
+                        macs = value.split()
                         if (
-                            any(
-                                not re.match(
-                                    rx,
-                                    v.lower()
-                                ) for v in value.split()
-                            ) or len(
-                                value.split()
-                            ) != 2 or any(
-                                value.split().count(v) > 1 for v in
-                                value.split()
+                            len(macs) != 2 or len(set(macs)) != 2 or any(
+                                not _MAC_RE.match(v.lower()) for v in macs
                             )
                         ):
                             iocage_lib.ioc_common.logit(
@@ -2350,7 +2475,7 @@ class IOCJson(IOCConfiguration):
                         value = 'none'
                 elif key == 'vnet_default_interface' and value not in (
                         'none', 'auto'):
-                    if value not in netifaces.interfaces():
+                    if value not in _cached_interfaces():
                         iocage_lib.ioc_common.logit(
                             {
                                 'level': 'EXCEPTION',
@@ -2471,8 +2596,10 @@ class IOCJson(IOCConfiguration):
             else:
                 err = f"{value} is not a valid value for {key}.\n"
 
-                if key not in ("interfaces", "memoryuse"):
-                    msg = f"Value must be {' or '.join(props[key])}"
+                if key == "priority":
+                    msg = "Value must be a number from 1 to 99"
+                elif key not in ("interfaces", "memoryuse"):
+                    msg = f"Value must be {' or '.join(_PROPS[key])}"
 
                 elif key == "interfaces":
                     msg = "Interfaces must be specified as a pair.\n" \
@@ -2493,7 +2620,7 @@ class IOCJson(IOCConfiguration):
             if self.cli:
                 msg = f"{key} cannot be changed by the user."
             else:
-                if key not in conf.keys():
+                if key not in conf:
                     msg = f"{key} is not a valid property!"
                 else:
                     return value, conf
@@ -2508,9 +2635,10 @@ class IOCJson(IOCConfiguration):
 
     def json_plugin_load(self):
         try:
-            with open(f"{self.location}/plugin/settings.json", "r") as \
-                    settings:
-                settings = json.load(settings)
+            # Settings are nested and get modified in place by the callers
+            settings = copy.deepcopy(
+                self.json_read(f"{self.location}/plugin/settings.json")
+            )
         except FileNotFoundError:
             msg = f"No settings.json exists in {self.location}/plugin!"
 
@@ -2532,7 +2660,8 @@ class IOCJson(IOCConfiguration):
 
         conf, write = self.json_load()
         uuid = conf["host_hostuuid"]
-        _path = Dataset(f"{self.pool}/iocage/jails/{uuid}").path
+        # json_load just read the config from the jail's mountpoint
+        _path = self.location
 
         # Plugin variables
         settings = self.json_plugin_load()
@@ -2580,7 +2709,8 @@ class IOCJson(IOCConfiguration):
     def json_plugin_set_value(self, prop):
         conf, write = self.json_load()
         uuid = conf["host_hostuuid"]
-        _path = Dataset(f"{self.pool}/iocage/jails/{uuid}").path
+        # json_load just read the config from the jail's mountpoint
+        _path = self.location
         status, _ = iocage_lib.ioc_list.IOCList().list_get_jid(uuid)
 
         # Plugin variables
@@ -2593,26 +2723,22 @@ class IOCJson(IOCConfiguration):
         readonly = False
 
         if "options" in prop:
-            prop = keys.split(".")[1:]
+            prop = prop[1:]
 
         prop_cmd = f"{serviceset},{','.join(prop)},{value}".split(",")
         setting = settings["options"]
 
         try:
-            while prop:
-                current = prop[0]
-                key = current
-                prop.remove(current)
-
-                if not prop:
-                    if setting[current]:
-                        try:
-                            restart = setting[current]["requirerestart"]
-                            readonly = setting[current]["readonly"]
-                        except KeyError:
-                            pass
-                else:
-                    setting = setting[current]
+            # Walk down to the last key, which holds the setting itself
+            for depth, key in enumerate(prop, 1):
+                if depth < len(prop):
+                    setting = setting[key]
+                elif setting[key]:
+                    try:
+                        restart = setting[key]["requirerestart"]
+                        readonly = setting[key]["readonly"]
+                    except KeyError:
+                        pass
 
             if readonly:
                 iocage_lib.ioc_common.logit({
@@ -2689,89 +2815,92 @@ class IOCJson(IOCConfiguration):
         date_fmt = "%Y-%m-%d@%H:%M:%S:%f"
         date_fmt_legacy = "%Y-%m-%d@%H:%M:%S"
 
-        # We don't want to rename datasets to a bunch of dates.
-        try:
-            datetime.datetime.strptime(tag, date_fmt)
+        # We don't want to rename datasets to a bunch of dates. Most tags
+        # can't be one, those don't need to go through strptime.
+        is_date = False
+        if _DATE_RE.match(tag):
+            # Legacy jails are missing the microseconds
+            for fmt in (date_fmt, date_fmt_legacy):
+                try:
+                    datetime.datetime.strptime(tag, fmt)
+                except ValueError:
+                    continue
 
+                is_date = True
+                break
+
+        if is_date:
             # For writing later
             tag = uuid
-        except ValueError:
+        else:
             try:
-                # This may fail the first time with legacy jails,
-                # making sure one more time that it's not a legacy jail
-                datetime.datetime.strptime(tag, date_fmt_legacy)
+                if self.stop and state:
+                    # This will allow the user to actually stop
+                    # the running jails before migration.
 
-                # For writing later
-                tag = uuid
-            except ValueError:
-                try:
-                    if self.stop and state:
-                        # This will allow the user to actually stop
-                        # the running jails before migration.
+                    return (conf, True, False)
 
-                        return (conf, True, False)
+                if state:
+                    iocage_lib.ioc_common.logit(
+                        {
+                            "level":
+                            "EXCEPTION",
+                            "message":
+                            f"{uuid} ({tag}) is running,"
+                            " all jails must be stopped"
+                            " before iocage will"
+                            " continue migration"
+                        },
+                        _callback=self.callback,
+                        silent=self.silent)
 
-                    if state:
-                        iocage_lib.ioc_common.logit(
-                            {
-                                "level":
-                                "EXCEPTION",
-                                "message":
-                                f"{uuid} ({tag}) is running,"
-                                " all jails must be stopped"
-                                " before iocage will"
-                                " continue migration"
-                            },
-                            _callback=self.callback,
-                            silent=self.silent)
+                jails_ds = f"{self.pool}/iocage/jails"
+                jails_path = f"{self.iocroot}/jails"
+                jail_parent_ds = f"{jails_ds}/{uuid}"
+                new_jail_parent_ds = f"{jails_ds}/{tag}"
+                jail = Dataset(jail_parent_ds)
+
+                # A template already renamed to a TAG has nothing left to
+                # migrate
+                if jail.exists:
+                    # Every dataset, mounted or not, parents first. They are
+                    # cloned below and the clones are mounted like their
+                    # source, so this is read before anything is changed
+                    old_datasets = get_mounted_dependents(jail_parent_ds)
+                    to_mount = {
+                        name.replace(uuid, tag)
+                        for name, mounted in old_datasets if mounted
+                    }
 
                     # Can't rename when the child is
                     # in a non-global zone
-                    jail_parent_ds = f"{self.pool}/iocage/jails/{uuid}"
                     jail_parent_data_obj = Dataset(
                         os.path.join(jail_parent_ds, 'data')
                     )
                     if jail_parent_data_obj.exists:
                         jail_parent_data_obj.set_property('jailed', 'off')
 
-                    jail = Dataset(jail_parent_ds)
                     snap = Snapshot(f'{jail_parent_ds}@{tag}')
                     if snap.exists:
                         iocage_lib.ioc_common.logit(
                             {
                                 'level': 'EXCEPTION',
                                 'message': f'Snapshot {snap.resource_name}'
-                                           'already exists'
+                                           ' already exists'
                             },
                             _callback=self.callback, silent=self.silent
                         )
-                    jail.create_snapshot(
-                        f'{jail_parent_ds}@{tag}', {'recursive': True}
-                    )
+                    snap.create_snapshot({'recursive': True})
 
-                    for snap in jail.snapshots_recursive():
-                        snap_name = snap.name
-
-                        # We only want our snapshot for this, the rest will
-                        # follow
-
-                        if snap_name == tag:
-                            new_dataset = snap.resource_name.replace(
-                                uuid, tag
-                            ).split('@')[0]
-                            snap.clone(new_dataset)
+                    # We only want our snapshot for this, the rest will
+                    # follow. Every dataset is cloned whether it is mounted
+                    # or not (a jailed data dataset never is), the old tree
+                    # is destroyed afterwards
+                    for name, _ in old_datasets:
+                        Snapshot(f'{name}@{tag}').clone(name.replace(uuid, tag))
 
                     # Datasets are not mounted upon creation
-                    new_jail_parent_ds = f"{self.pool}/iocage/jails/{tag}"
-                    new_jail = Dataset(new_jail_parent_ds)
-                    if not new_jail.mounted:
-                        new_jail.mount()
-                    new_jail.promote()
-
-                    for new_ds in new_jail.get_dependents(depth=None):
-                        if not new_ds.mounted:
-                            new_ds.mount()
-                        new_ds.promote()
+                    _mount_and_promote(new_jail_parent_ds, to_mount)
 
                     # Easier.
                     su.check_call([
@@ -2785,39 +2914,31 @@ class IOCJson(IOCConfiguration):
                     if new_jail_parent_ds_obj.exists:
                         new_jail_parent_ds_obj.set_property('jailed', 'on')
 
-                    for line in fileinput.input(
-                            f"{self.iocroot}/jails/{tag}/root/etc/rc.conf",
-                            inplace=1):
-                        print(
-                            line.replace(f'hostname="{uuid}"',
-                                         f'hostname="{tag}"').rstrip())
+                    new_jail_path = f"{jails_path}/{tag}"
+                    _replace_in_file(
+                        f"{new_jail_path}/root/etc/rc.conf",
+                        f'hostname="{uuid}"', f'hostname="{tag}"'
+                    )
 
                     if iocage_lib.ioc_common.check_truthy(conf["basejail"]):
-                        for line in fileinput.input(
-                                f"{self.iocroot}/jails/{tag}/fstab",
-                                inplace=1):
-                            print(line.replace(f'{uuid}', f'{tag}').rstrip())
+                        _replace_in_file(f"{new_jail_path}/fstab", uuid, tag)
 
                     jail.destroy(recursive=True, force=True)
 
-                    try:
-                        shutil.rmtree(f"{self.iocroot}/jails/{uuid}")
-                    except Exception:
-                        # Sometimes it becomes a directory when legacy short
-                        # UUIDs are involved
-                        pass
+                    # Sometimes it becomes a directory when legacy short
+                    # UUIDs are involved, otherwise the destroy removed it
+                    old_jail_path = f"{jails_path}/{uuid}"
+                    if os.path.isdir(old_jail_path) and not os.path.ismount(
+                        old_jail_path
+                    ):
+                        shutil.rmtree(old_jail_path, ignore_errors=True)
 
                     # Cleanup our snapshot from the cloning process
+                    Snapshot(f'{new_jail_parent_ds}@{tag}').destroy()
 
-                    for snap in new_jail.snapshots_recursive():
-                        snap_name = snap.name
-
-                        if snap_name == tag:
-                            snap.destroy()
-
-                except Exception:
-                    # A template, already renamed to a TAG
-                    pass
+            except Exception:
+                # A template, already renamed to a TAG
+                pass
 
         conf["host_hostuuid"] = tag
 
@@ -113,8 +113,7 @@ class IOCStart(object):
                 exception=ioc_exceptions.JailRunning)
 
         if self.conf['hostid_strict_check']:
-            with open("/etc/hostid", "r") as _file:
-                hostid = _file.read().strip()
+            hostid = iocage_lib.ioc_json.IOCConfiguration.get_hostid()
             if self.conf["hostid"] != hostid:
                 iocage_lib.ioc_common.logit({
                     "level": "ERROR",
@@ -7,8 +7,6 @@ from iocage_lib.zfs import (
 
 import iocage_lib.dataset as dataset
 
-from copy import deepcopy
-
 
 Dataset = dataset.Dataset
 
@@ -20,7 +18,7 @@ class Pool(Resource):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.cache:
-            self._properties = deepcopy(cache.pools.get(self.resource_name))
+            self._properties = cache.pools.get(self.resource_name)
 
     @property
     def active(self):
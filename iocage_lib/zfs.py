@@ -91,9 +91,17 @@ def pool_properties(pool):
 
 
 def iocage_activated_pool():
-    for pool in list_pools():
-        if dataset_properties(pool).get('org.freebsd.ioc:active') == 'yes':
-            return pool
+    pools = list_pools()
+    if not pools:
+        return None
+
+    # Only the one property matters, ask for it on every pool at once
+    # instead of retrieving all properties of each pool's root dataset
+    for line in run([
+        'zfs', 'get', '-H', '-o', 'name,value', IOCAGE_POOL_PROP, *pools
+    ]).stdout.split('\n'):
+        if line and line.split('\t')[-1].strip() == 'yes':
+            return line.split('\t')[0].strip()
     else:
         return None
 
@@ -123,6 +131,17 @@ def get_dependents(identifier, depth=None, filters=None):
         return get_dependents_with_depth(identifier, datasets, depth)
 
 
+def get_mounted_dependents(identifier):
+    # Name and mounted state of the filesystem and all of its dependents,
+    # parents come before their children
+    return [
+        (line.split('\t')[0], line.split('\t')[-1] == 'yes')
+        for line in run([
+            'zfs', 'list', '-t', 'filesystem', '-rHo', 'name,mounted', identifier
+        ]).stdout.split('\n') if line
+    ]
+
+
 def get_dependents_with_depth(identifier, datasets, depth=None):
     id_depth = len(identifier.split('/'))
     return list(
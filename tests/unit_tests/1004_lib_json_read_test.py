@@ -0,0 +1,52 @@
+import json
+import os
+
+from iocage_lib.ioc_json import IOCConfiguration
+
+
+def write_config(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def test_01_json_read_returns_parsed_file(tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_config(path, {'host_hostuuid': 'foo', 'boot': 0})
+
+    assert IOCConfiguration.json_read(path) == {
+        'host_hostuuid': 'foo', 'boot': 0
+    }
+
+
+def test_02_json_read_result_can_be_modified(tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_config(path, {'boot': 0})
+
+    conf = IOCConfiguration.json_read(path)
+    conf['boot'] = 1
+
+    assert IOCConfiguration.json_read(path) == {'boot': 0}
+
+
+def test_03_json_read_picks_up_changes_on_disk(tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_config(path, {'boot': 0})
+    IOCConfiguration.json_read(path)
+
+    write_config(path, {'boot': 1, 'notes': 'none'})
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+
+    assert IOCConfiguration.json_read(path) == {'boot': 1, 'notes': 'none'}
+
+
+def test_04_json_write_refreshes_cached_read(tmp_path):
+    path = str(tmp_path / 'config.json')
+    write_config(path, {'boot': 0})
+    IOCConfiguration.json_read(path)
+
+    conf = IOCConfiguration.__new__(IOCConfiguration)
+    conf.location = str(tmp_path)
+    conf.json_write({'boot': 1})
+
+    assert IOCConfiguration.json_read(path) == {'boot': 1}
@@ -0,0 +1,29 @@
+import pytest
+
+from iocage_lib.ioc_json import IOCJson
+
+
+def get_iocjson():
+    iocjson = IOCJson.__new__(IOCJson)
+    iocjson.callback = None
+    iocjson.silent = True
+    iocjson.cli = True
+    return iocjson
+
+
+@pytest.mark.parametrize('value', ['1', '50', '99'])
+def test_01_priority_in_range(value):
+    conf = {}
+    assert get_iocjson().json_check_prop('priority', value, conf) == (
+        value, conf
+    )
+
+
+@pytest.mark.parametrize(
+    'value', ['0', '100', '150', '-1', 'high', '', '5_0', ' 7 ', '+5', '\u0665']
+)
+def test_02_priority_out_of_range(value):
+    with pytest.raises(
+        RuntimeError, match='is not a valid value for priority'
+    ):
+        get_iocjson().json_check_prop('priority', value, {})
@@ -0,0 +1,39 @@
+import pytest
+
+from iocage_lib.ioc_common import get_jail_freebsd_version
+
+
+FREEBSD_VERSION = '''#!/bin/sh
+set -e
+
+USERLAND_VERSION="13.1-RELEASE-p3"
+
+case $1 in
+-u)
+    echo $USERLAND_VERSION
+    ;;
+esac
+'''
+
+
+def write_freebsd_version(tmp_path, content):
+    (tmp_path / 'bin').mkdir()
+    (tmp_path / 'bin' / 'freebsd-version').write_text(content)
+    return str(tmp_path)
+
+
+def test_01_userland_version_is_read(tmp_path):
+    path = write_freebsd_version(tmp_path, FREEBSD_VERSION)
+
+    assert get_jail_freebsd_version(path, '13.1-RELEASE') == '13.1-RELEASE-p3'
+
+
+def test_02_old_releases_are_returned_as_is(tmp_path):
+    assert get_jail_freebsd_version(str(tmp_path), '9.3-RELEASE') == '9.3-RELEASE'
+
+
+def test_03_missing_userland_version_raises(tmp_path):
+    path = write_freebsd_version(tmp_path, '#!/bin/sh\n')
+
+    with pytest.raises(RuntimeError):
+        get_jail_freebsd_version(path, '13.1-RELEASE')
@@ -0,0 +1,17 @@
+from unittest.mock import patch
+
+from iocage_lib.ioc_json import _NETIFACES_TTL, _cached_interfaces
+
+
+@patch('iocage_lib.ioc_json.time')
+@patch('iocage_lib.ioc_json.netifaces.interfaces')
+def test_01_interfaces_are_looked_up_again_after_ttl(mock_interfaces, mock_time):
+    mock_interfaces.side_effect = [['em0'], ['em0', 'bridge0']]
+    mock_time.monotonic.return_value = 1000 * _NETIFACES_TTL
+
+    assert _cached_interfaces() == {'em0'}
+    assert _cached_interfaces() == {'em0'}
+    assert mock_interfaces.call_count == 1
+
+    mock_time.monotonic.return_value += _NETIFACES_TTL
+    assert _cached_interfaces() == {'em0', 'bridge0'}